@@ -1,9 +1,13 @@
 import streamlit as st
 import pandas as pd
 import altair as alt
-from prophet import Prophet
 from io import BytesIO
 import numpy as np
+import pyarrow as pa
+import hashlib
+import importlib
+import os
+import tempfile
 
 st.set_page_config(page_title="Utility Dashboard", layout="wide")
 
@@ -54,27 +58,128 @@ st.markdown("""
 # -----------------------------
 # DATA LOADER
 # -----------------------------
-@st.cache_data
-def load_data():
-    df = pd.read_excel("gridforge_1.1.xlsx", sheet_name="Property")
+DATA_FILE = "gridforge_1.1.xlsx"
+DATA_SHEET = "Property"
+
+# Columns the dashboard actually reads
+DATA_COLUMNS = ["Billing Date", "Property Name", "Utility", "$ Amount", "Usage"]
+
+# Schema baked into the parquet at ingest time
+DATA_DTYPES = {
+    "Property Name": "string",
+    "Utility": "category",
+}
+
+
+def _read_bills(xlsx_path, sheet_name=DATA_SHEET):
+    """Read the bills from a parquet sibling of the workbook.
+
+    The parquet is rebuilt from the workbook sheet when missing or stale.
+    Its name carries a hash of DATA_COLUMNS/DATA_DTYPES, so changing the
+    schema never picks up a copy written for the old one. If it can't be
+    written (e.g. read-only checkout) the parsed sheet is returned directly.
+    """
+    schema = hashlib.blake2b(
+        repr((DATA_COLUMNS, DATA_DTYPES)).encode(), digest_size=4
+    ).hexdigest()
+    pq_path = f"{os.path.splitext(xlsx_path)[0]}.{schema}.parquet"
+
+    if os.path.exists(pq_path) and os.path.getmtime(pq_path) >= os.path.getmtime(xlsx_path):
+        return pd.read_parquet(pq_path, columns=DATA_COLUMNS)
 
-    # Clean dates
+    # Only parse the columns the dashboard reads
+    df = pd.read_excel(xlsx_path, sheet_name=sheet_name, usecols=DATA_COLUMNS)
+
+    # Dates are stored as text like "1.13.26"
     df["Billing Date"] = pd.to_datetime(df["Billing Date"], errors="coerce")
+    df = df.astype(DATA_DTYPES)
+
+    # Write to a temp file and swap it in, so a crash or a concurrent
+    # conversion never leaves a truncated parquet that looks fresh
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(pq_path)),
+            prefix=os.path.basename(pq_path) + ".",
+            suffix=".parquet",
+        )
+        os.close(fd)
+        df.to_parquet(tmp_path, engine="pyarrow", compression="zstd")
+        os.replace(tmp_path, pq_path)
+    except OSError:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return df[DATA_COLUMNS]
+
+
+@st.cache_data(max_entries=1, ttl="1d", show_spinner=False)
+def load_data():
+    df = _read_bills(DATA_FILE)
+
+    # Month + Year (nullable: bills with an unparseable date still count)
+    df["Year"] = df["Billing Date"].dt.year.astype("Int16")
+    df["MonthNum"] = df["Billing Date"].dt.month.astype("Int8")
 
-    # Month + Year
-    df["Year"] = df["Billing Date"].dt.year
-    df["Month"] = df["Billing Date"].dt.month_name().str[:3]
+    # Cost per unit (NaN instead of inf when there was no usage)
+    amount = df["$ Amount"].to_numpy(np.float32)
+    usage = df["Usage"].to_numpy(np.float32)
+    df["Cost_per_Unit"] = np.divide(
+        amount, usage, out=np.full(len(df), np.nan, dtype=np.float32), where=usage != 0
+    )
+
+    # Shrink the cached frame: categoricals for labels, float32 for
+    # quantities. $ Amount stays float64 so money adds up to the cent.
+    for col in ("Property Name", "Utility"):
+        df[col] = df[col].astype("category").cat.remove_unused_categories()
+
+    df["Usage"] = df["Usage"].astype("float32")
+
+    # Aggregate in float64 so the totals and averages users see are exact
+    agg_src = df.astype({"Usage": "float64", "Cost_per_Unit": "float64"})
+
+    # Small aggregate cubes the charts slice instead of regrouping every rerun
+    agg_ym_prop_util = agg_src.groupby(
+        ["Property Name", "Utility", "Year", "MonthNum"], observed=True, as_index=False
+    )[["$ Amount", "Usage"]].sum()
+
+    # Portfolio summary per property/utility, held as an Arrow table for display
+    summary = agg_src.groupby(["Property Name", "Utility"], observed=True).agg(
+        Total_Usage=("Usage", "sum"),
+        Total_Cost=("$ Amount", "sum"),
+        Avg_Monthly_Cost=("$ Amount", "mean"),
+        Avg_Cost_per_Unit=("Cost_per_Unit", "mean"),
+    ).reset_index()
+    summary_arrow = pa.Table.from_pandas(summary, preserve_index=False)
+
+    prop_totals = (
+        summary.groupby("Property Name", observed=True, as_index=False)
+        [["Total_Usage", "Total_Cost"]].sum()
+        .sort_values("Total_Cost", ascending=False)
+    )
 
-    month_order = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
-    df["Month"] = pd.Categorical(df["Month"], categories=month_order, ordered=True)
+    agg_date_prop_util = agg_src.groupby(
+        ["Property Name", "Utility", "Year", "Billing Date"], observed=True, as_index=False
+    )["$ Amount"].sum()
 
-    # Cost per unit
-    df["Cost_per_Unit"] = df["$ Amount"] / df["Usage"]
+    # Filter options; categoricals store only their used levels, sorted
+    props = df["Property Name"].cat.categories.tolist()
+    utils = df["Utility"].cat.categories.tolist()
+    years = sorted(df["Year"].dropna().unique().tolist())
 
-    return df, month_order
+    # Ties per-selection caches to the workbook this load came from
+    data_version = os.path.getmtime(DATA_FILE)
+
+    return (
+        df, agg_ym_prop_util, agg_date_prop_util, summary_arrow, prop_totals,
+        props, utils, years, data_version,
+    )
 
 with st.spinner("Loading latest data…"):
-    df, month_order = load_data()
+    (
+        df, agg_ym_prop_util, agg_date_prop_util, summary_arrow, prop_totals,
+        props, utils, years, data_version,
+    ) = load_data()
 
 last_updated = df["Billing Date"].max()
 
@@ -97,11 +202,11 @@ if not st.session_state["show_dashboard"]:
 
     c1, c2, c3 = st.columns(3)
     with c1:
-        st.metric("Total Properties", df["Property Name"].nunique())
+        st.metric("Total Properties", len(props))
     with c2:
-        st.metric("Total Utilities", df["Utility"].nunique())
+        st.metric("Total Utilities", len(utils))
     with c3:
-        st.metric("Years of History", df["Year"].nunique())
+        st.metric("Years of History", len(years))
 
     st.markdown("<br>", unsafe_allow_html=True)
 
@@ -133,32 +238,91 @@ col1, col2, col3 = st.columns(3)
 with col1:
     selected_property = st.selectbox(
         "Select Property",
-        ["All"] + sorted(df["Property Name"].unique())
+        ["All"] + props
     )
 
 with col2:
     selected_utility = st.selectbox(
         "Select Utility",
-        ["All"] + sorted(df["Utility"].unique())
+        ["All"] + utils
     )
 
 with col3:
     selected_year = st.selectbox(
         "Select Year",
-        ["All"] + sorted(df["Year"].unique())
+        ["All"] + years
     )
 
-# Apply filters
-filtered = df.copy()
 
-if selected_property != "All":
-    filtered = filtered[filtered["Property Name"] == selected_property]
+selection = (selected_property, selected_utility, selected_year)
+
+
+def apply_filters(frame, prop, util, year):
+    """Slice the bills (or any aggregate cube) to the selected filters.
+
+    The conditions are combined into one mask so the frame is sliced once.
+    """
+    mask = np.ones(len(frame), dtype=bool)
+
+    if prop != "All":
+        mask &= (frame["Property Name"] == prop).to_numpy()
+
+    if util != "All":
+        mask &= (frame["Utility"] == util).to_numpy()
+
+    if year != "All":
+        mask &= (frame["Year"] == year).to_numpy(dtype=bool, na_value=False)
+
+    return frame.iloc[np.flatnonzero(mask)]
+
+
+filtered = apply_filters(df, *selection)
 
-if selected_utility != "All":
-    filtered = filtered[filtered["Utility"] == selected_utility]
+# -----------------------------
+# FORECAST HELPERS
+# -----------------------------
+@st.cache_resource(max_entries=32)
+def _fit_prophet(key, ds_ts, y_vals):
+    """Fit Prophet once per filter selection; inputs are raw series bytes."""
+    train = pd.DataFrame({
+        "ds": np.frombuffer(ds_ts, dtype="datetime64[ns]"),
+        "y": np.frombuffer(y_vals, dtype=np.float64),
+    })
+
+    # Imported here so cold starts that never open the forecast skip it
+    prophet = importlib.import_module("prophet")
+
+    model = prophet.Prophet()
+    model.fit(train)
+    return model
+
+
+@st.cache_data(max_entries=64, ttl=3600)
+def _predict(_model, key, series_hash, periods):
+    """Forecast from a fitted model, cached on the selection and series content.
+
+    The model itself isn't hashed; key and series_hash identify what it was
+    fitted on.
+    """
+    future = _model.make_future_dataframe(periods=periods)
+
+    # Only the columns the chart encodes are cached and sent to the browser
+    return _model.predict(future)[["ds", "yhat"]]
+
+
+@st.cache_data(max_entries=64, ttl=3600, show_spinner=False)
+def forecast_series(data_version, prop, util, year):
+    """Spend per billing date for one filter selection, shaped for Prophet.
+
+    Reads the module-level cube; data_version keys the entry to the load
+    that built it.
+    """
+    return (
+        apply_filters(agg_date_prop_util, prop, util, year)
+        .groupby("Billing Date", as_index=False)["$ Amount"].sum()
+        .rename(columns={"Billing Date": "ds", "$ Amount": "y"})
+    )
 
-if selected_year != "All":
-    filtered = filtered[filtered["Year"] == selected_year]
 
 # -----------------------------
 # METRICS
@@ -171,99 +335,105 @@ m3.metric("Avg Cost/Unit", f"${filtered['Cost_per_Unit'].mean():.2f}")
 m4.metric("Bills Count", f"{len(filtered):,}")
 
 # -----------------------------
-# COST TREND
+# VIEW SELECTOR
 # -----------------------------
-st.markdown("### Monthly Cost Trend")
+# Only the selected view runs, so Prophet isn't fitted unless it's viewed
+VIEWS = ["Trends", "Forecast", "Spend by Property"]
 
-cost_trend = (
-    filtered.groupby(["Year", "Month"], as_index=False)["$ Amount"].sum()
-)
-
-chart = (
-    alt.Chart(cost_trend)
-    .mark_line(point=True)
-    .encode(
-        x=alt.X("Month", sort=month_order),
-        y="$ Amount",
-        color="Year:N"
-    )
-    .properties(height=350)
-)
+# Month numbers on the x axis, labelled client-side
+MONTH_NAMES_EXPR = "['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec']"
 
-st.altair_chart(chart, use_container_width=True)
+MONTH_AXIS = alt.Axis(title="Month", labelExpr=f"{MONTH_NAMES_EXPR}[datum.value - 1]")
 
-# -----------------------------
-# USAGE TREND
-# -----------------------------
-st.markdown("### Monthly Usage Trend")
+active_view = st.radio("View", VIEWS, horizontal=True, label_visibility="collapsed")
 
-usage_trend = (
-    filtered.groupby(["Year", "Month"], as_index=False)["Usage"].sum()
-)
+if active_view == "Trends":
+    # -----------------------------
+    # COST & USAGE TREND
+    # -----------------------------
+    st.markdown("### Monthly Cost & Usage Trends")
 
-chart2 = (
-    alt.Chart(usage_trend)
-    .mark_line(point=True)
-    .encode(
-        x=alt.X("Month", sort=month_order),
-        y="Usage",
-        color="Year:N"
+    trend = (
+        apply_filters(agg_ym_prop_util, *selection)
+        .groupby(["Year", "MonthNum"], as_index=False)[["$ Amount", "Usage"]].sum()
     )
-    .properties(height=350)
-)
 
-st.altair_chart(chart2, use_container_width=True)
+    # One spec over a shared dataset: cost on top, usage below
+    base = (
+        alt.Chart(trend)
+        .transform_calculate(Month=f"{MONTH_NAMES_EXPR}[datum.MonthNum - 1]")
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("MonthNum:O", axis=MONTH_AXIS),
+            color="Year:N",
+            tooltip=["Year:N", "Month:N", "$ Amount:Q", "Usage:Q"]
+        )
+        .properties(height=350)
+    )
 
-# -----------------------------
-# FORECASTING
-# -----------------------------
-st.markdown("### Forecasting (Prophet)")
+    chart = alt.vconcat(
+        base.encode(y="$ Amount:Q").properties(title="Monthly Cost Trend"),
+        base.encode(y="Usage:Q").properties(title="Monthly Usage Trend"),
+    )
 
-forecast_df = (
-    filtered.groupby("Billing Date", as_index=False)["$ Amount"].sum()
-    .rename(columns={"Billing Date": "ds", "$ Amount": "y"})
-)
+    st.altair_chart(chart, use_container_width=True)
+
+elif active_view == "Forecast":
+    # -----------------------------
+    # FORECASTING
+    # -----------------------------
+    st.markdown("### Forecasting (Prophet)")
+
+    forecast_df = forecast_series(data_version, *selection)
+
+    if len(forecast_df) > 3:
+        forecast_key = "|".join(map(str, selection))
+        ds_ts = forecast_df["ds"].to_numpy("datetime64[ns]").tobytes()
+        y_vals = forecast_df["y"].to_numpy(np.float64).tobytes()
+        series_hash = hashlib.blake2b(ds_ts + y_vals, digest_size=8).hexdigest()
+
+        # Same selection and same series as last run: reuse the forecast as-is
+        if st.session_state.get(f"prophet_hash:{forecast_key}") == series_hash:
+            forecast = st.session_state[f"prophet_forecast:{forecast_key}"]
+        else:
+            model = _fit_prophet(selection, ds_ts, y_vals)
+            forecast = _predict(model, selection, series_hash, 90)
+            st.session_state[f"prophet_hash:{forecast_key}"] = series_hash
+            st.session_state[f"prophet_forecast:{forecast_key}"] = forecast
+
+        forecast_chart = (
+            alt.Chart(forecast)
+            .mark_line()
+            .encode(
+                x="ds:T",
+                y="yhat:Q"
+            )
+            .properties(height=350)
+        )
 
-if len(forecast_df) > 3:
-    model = Prophet()
-    model.fit(forecast_df)
+        st.altair_chart(forecast_chart, use_container_width=True)
+    else:
+        st.info("Not enough data for forecasting.")
 
-    future = model.make_future_dataframe(periods=90)
-    forecast = model.predict(future)
+elif active_view == "Spend by Property":
+    # -----------------------------
+    # PROPERTY BREAKDOWN
+    # -----------------------------
+    st.markdown("### Spend by Property")
 
-    forecast_chart = (
-        alt.Chart(forecast)
-        .mark_line()
+    bar = (
+        alt.Chart(prop_totals)
+        .mark_bar()
         .encode(
-            x="ds:T",
-            y="yhat:Q"
+            x="Property Name:N",
+            y=alt.Y("Total_Cost:Q", title="$ Amount"),
+            tooltip=["Property Name", "Total_Cost", "Total_Usage"]
         )
-        .properties(height=350)
+        .properties(height=400)
     )
 
-    st.altair_chart(forecast_chart, use_container_width=True)
-else:
-    st.info("Not enough data for forecasting.")
+    st.altair_chart(bar, use_container_width=True)
 
-# -----------------------------
-# PROPERTY BREAKDOWN
-# -----------------------------
-st.markdown("### Spend by Property")
-
-prop_breakdown = (
-    df.groupby("Property Name", as_index=False)["$ Amount"].sum()
-    .sort_values("$ Amount", ascending=False)
-)
-
-bar = (
-    alt.Chart(prop_breakdown)
-    .mark_bar()
-    .encode(
-        x="Property Name:N",
-        y="$ Amount:Q",
-        tooltip=["Property Name", "$ Amount"]
-    )
-    .properties(height=400)
-)
+    st.markdown("### Property & Utility Summary")
 
-st.altair_chart(bar, use_container_width=True)
+    st.dataframe(summary_arrow, use_container_width=True, hide_index=True)